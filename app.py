@@ -1,62 +1,266 @@
 import streamlit as st
 import pandas as pd
-from geopy.distance import geodesic
+import numpy as np
 import io
+import math
+
+try:
+    import numba
+except ImportError:  # Numba is optional; without it the NumPy kernel below is used
+    numba = None
 
 # Set the page to a wide layout for better data viewing
 st.set_page_config(layout="wide")
 
-def calculate_distances(df):
+# Mean Earth radius (IUGG) used by the haversine formula
+EARTH_RADIUS_KM = 6371.0088
+
+# Upper edges in kilometers of each half-open [lower, upper) bucket, and the bucket labels.
+# "N/A" is kept last and is reserved for zero distances.
+BUCKET_EDGES = np.array([1.0, 2.0, 3.0, 4.0, 5.0])
+BUCKET_LABELS = ["< 1 km", "1 - 2 km", "2 - 3 km", "3 - 4 km", "4 - 5 km", "> 5 km", "N/A"]
+NA_BUCKET_CODE = BUCKET_LABELS.index("N/A")
+
+def haversine_km(dlat, dlon, cos_lat1, cos_lat2):
+    """
+    Evaluates the haversine great-circle distance from precomputed coordinate terms.
+
+    Args:
+        dlat (np.ndarray): Latitude differences between the end and start points, in radians.
+        dlon (np.ndarray): Longitude differences between the end and start points, in radians.
+        cos_lat1 (np.ndarray): Cosines of the start latitudes.
+        cos_lat2 (np.ndarray): Cosines of the end latitudes.
+
+    Returns:
+        np.ndarray: The distances in kilometers. NaN where a coordinate is missing.
+    """
+    # a = sin²(Δφ/2) + cos φ1 · cos φ2 · sin²(Δλ/2), evaluated in place on two scratch
+    # buffers so the chain doesn't allocate a fresh temporary array for every operation
+    a = np.multiply(dlat, 0.5)
+    np.sin(a, out=a)
+    np.square(a, out=a)
+    b = np.multiply(dlon, 0.5)
+    np.sin(b, out=b)
+    np.square(b, out=b)
+    b *= cos_lat1
+    b *= cos_lat2
+    a += b
+
+    # Clamp rounding error so near-antipodal points don't produce NaN
+    np.minimum(a, 1.0, out=a)
+    np.sqrt(a, out=a)
+    np.arcsin(a, out=a)
+    a *= 2 * EARTH_RADIUS_KM
+    return a
+
+def bucket_codes(km, out):
+    """
+    Categorizes distances in kilometers into predefined buckets.
+
+    Args:
+        km (np.ndarray): The distances in kilometers.
+        out (np.ndarray): Preallocated int8 output for each distance's index into BUCKET_LABELS.
+            Zero distances get the "N/A" code.
+    """
+    # One binary search per distance over the sorted edges gives each bucket's code directly
+    out[:] = np.searchsorted(BUCKET_EDGES, km, side='right')
+    out[km == 0] = NA_BUCKET_CODE
+
+if numba is not None:
+    @st.cache_resource
+    def load_haversine_kernel():
+        """
+        Compiles the Numba distance kernel once per server process.
+
+        Returns:
+            Callable: The compiled haversine_consecutive_km kernel.
+        """
+        # All fast-math flags except 'nnan'/'ninf', so missing (NaN) coordinates are still detected.
+        # The explicit signature compiles eagerly here instead of on the first dataset, and
+        # cache=True lets later processes load the machine code from disk instead of recompiling.
+        @numba.njit(
+            'void(float32[::1], float32[::1], float64[::1], int8[::1])',
+            cache=True,
+            fastmath={'nsz', 'arcp', 'contract', 'afn', 'reassoc'},
+        )
+        def haversine_consecutive_km(lats, lons, out, codes):
+            """
+            Fills `out` with the haversine distance from each point to its predecessor, and `codes`
+            with each distance's bucket, in one fused pass.
+
+            Args:
+                lats (np.ndarray): Latitudes of the points, in degrees.
+                lons (np.ndarray): Longitudes of the points, in degrees.
+                out (np.ndarray): Preallocated distance output; out[0] is left untouched.
+                codes (np.ndarray): Preallocated int8 output for the indexes into BUCKET_LABELS.
+            """
+            codes[0] = NA_BUCKET_CODE  # The first location has no preceding point
+            # Each point ends one pair and starts the next, so its radians and cosine are carried
+            # over to the following iteration instead of being recomputed
+            lat1 = math.radians(lats[0])
+            lon1 = math.radians(lons[0])
+            cos_lat1 = math.cos(lat1)
+            for i in range(1, lats.size):
+                lat2 = math.radians(lats[i])
+                lon2 = math.radians(lons[i])
+                cos_lat2 = math.cos(lat2)
+                sin_dlat = math.sin((lat2 - lat1) * 0.5)
+                sin_dlon = math.sin((lon2 - lon1) * 0.5)
+                a = sin_dlat * sin_dlat + cos_lat1 * cos_lat2 * sin_dlon * sin_dlon
+                d = 2.0 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0)))
+                if math.isnan(d) or d == 0.0:
+                    out[i] = 0.0  # Handle cases with missing lat/lon
+                    codes[i] = NA_BUCKET_CODE
+                else:
+                    out[i] = d
+                    # Branchless bucket search: count the edges at or below the distance
+                    code = 0
+                    for edge in BUCKET_EDGES:
+                        code += d >= edge
+                    codes[i] = code
+                lat1, lon1, cos_lat1 = lat2, lon2, cos_lat2
+
+        return haversine_consecutive_km
+
+    # Build the kernel as soon as the page loads, rather than when the first data arrives
+    haversine_consecutive_km = load_haversine_kernel()
+
+def calculate_distances(df, within_society=False, codes=None):
     """
     Calculates the distance between consecutive points in a DataFrame.
 
     Args:
-        df (pd.DataFrame): DataFrame with 'Latitude' and 'Longitude' columns.
+        df (pd.DataFrame): DataFrame with 'Latitude' and 'Longitude' columns, plus 'Society ID'
+            when `within_society` is set.
+        within_society (bool): If True, measure each point from the previous point with the same
+            'Society ID' rather than from the previous row.
+        codes (np.ndarray, optional): Preallocated int8 array to fill with each distance's index
+            into BUCKET_LABELS. The Numba kernel computes these in the same pass as the distances.
 
     Returns:
-        list: A list of distances in kilometers. The first element is 0.
+        np.ndarray: The distances in kilometers. The first element (the first point of each
+            society, with `within_society`) is 0.
     """
-    distances = [0.0]  # The first location has no preceding point
-    for i in range(1, len(df)):
-        # Get coordinates for the current and previous point
-        point1 = (df['Latitude'].iloc[i-1], df['Longitude'].iloc[i-1])
-        point2 = (df['Latitude'].iloc[i], df['Longitude'].iloc[i])
-
-        # Calculate the distance and append to the list
-        if pd.notna(point1[0]) and pd.notna(point1[1]) and pd.notna(point2[0]) and pd.notna(point2[1]):
-            distance_km = geodesic(point1, point2).kilometers
-            distances.append(distance_km)
-        else:
-            distances.append(0.0) # Handle cases with missing lat/lon
+    distances = np.zeros(len(df))  # The first location has no preceding point
+    if len(df) < 2:
+        # No consecutive pairs, so skip the haversine pass entirely
+        if codes is not None:
+            codes[:] = NA_BUCKET_CODE
+        return distances
+
+    # float32 keeps distances to within about a metre, far finer than the 1 km buckets, and halves the
+    # memory traffic of the haversine pass
+    lats = df['Latitude'].to_numpy(dtype=np.float32)
+    lons = df['Longitude'].to_numpy(dtype=np.float32)
+
+    if within_society:
+        # Pair each point with the previous point of its own society in one vectorized pass;
+        # a society's first point has no predecessor, so its NaN distance becomes 0 below
+        prev = df.groupby('Society ID', sort=False)[['Latitude', 'Longitude']].shift(1)
+        prev_lats = np.radians(prev['Latitude'].to_numpy(dtype=np.float32))
+        prev_lons = np.radians(prev['Longitude'].to_numpy(dtype=np.float32))
+        lats = np.radians(lats)
+        lons = np.radians(lons)
+        distances[:] = haversine_km(lats - prev_lats, lons - prev_lons, np.cos(prev_lats), np.cos(lats))
+        distances[np.isnan(distances)] = 0.0
+        if codes is not None:
+            bucket_codes(distances, codes)
+        return distances
+
+    if numba is not None:
+        # Fused loop: reads each coordinate once and writes each distance and bucket code once,
+        # with no temporaries
+        if codes is None:
+            codes = np.empty(len(df), dtype=np.int8)
+        haversine_consecutive_km(lats, lons, distances, codes)
+        return distances
+
+    lats = np.radians(lats)
+    lons = np.radians(lons)
+    # Every point is the end of one pair and the start of the next, so each cosine is
+    # computed once here and shared by both pairs
+    cos_lats = np.cos(lats)
+
+    # Compare every point with its predecessor in a single vectorized pass; the float32
+    # result is widened back to float64 for display and CSV export
+    distances[1:] = haversine_km(np.diff(lats), np.diff(lons), cos_lats[:-1], cos_lats[1:])
+    distances[np.isnan(distances)] = 0.0  # Handle cases with missing lat/lon
+    if codes is not None:
+        bucket_codes(distances, codes)
     return distances
 
-def bucketize_distance(km):
+def load_locations(raw):
     """
-    Categorizes a distance in kilometers into predefined buckets.
+    Parses location data.
 
     Args:
-        km (float): The distance in kilometers.
+        raw (bytes): The pasted or uploaded data, one 'Society ID Latitude Longitude' row per line.
 
     Returns:
-        str: The corresponding distance bucket.
+        pd.DataFrame: DataFrame with 'Society ID', 'Latitude' and 'Longitude' columns.
     """
-    if km is None or km == 0:
-        return "N/A"
-    elif km < 1:
-        return "< 1 km"
-    elif 1 <= km < 2:
-        return "1 - 2 km"
-    elif 2 <= km < 3:
-        return "2 - 3 km"
-    elif 3 <= km < 4:
-        return "3 - 4 km"
-    elif 4 <= km < 5:
-        return "4 - 5 km"
-    else: # km >= 5
-        return "> 5 km"
+    # Use `sep=r'\s+'` to handle space-separated values; the C parser treats it as a fast
+    # whitespace tokenizer rather than a regex. Declare the coordinate dtypes up front so the
+    # parser writes float64 columns directly instead of inferring them.
+    return pd.read_csv(
+        io.BytesIO(raw),
+        header=None,
+        sep=r'\s+',
+        names=['Society ID', 'Latitude', 'Longitude'],
+        dtype={'Latitude': np.float64, 'Longitude': np.float64},
+    )
+
+def convert_df_to_csv(df_to_convert):
+    """
+    Converts a processed DataFrame to CSV format in memory.
+
+    Args:
+        df_to_convert (pd.DataFrame): The processed data.
+
+    Returns:
+        bytes: The UTF-8 encoded CSV, without the index.
+    """
+    # Round distances in the export only, leaving the coordinates' precision untouched
+    return df_to_convert.round({'Distance (km)': 2}).to_csv(index=False).encode('utf-8')
+
+@st.cache_data
+def process_locations(raw, within_society=False):
+    """
+    Parses location data and adds distance and bucket columns, caching the result so reruns
+    with unchanged input skip the whole pipeline.
+
+    Args:
+        raw (bytes): The pasted or uploaded data, one 'Society ID Latitude Longitude' row per line.
+        within_society (bool): If True, only measure distances between points of the same society.
+
+    Returns:
+        tuple: The parsed data as a pd.DataFrame with 'Distance (km)' and 'Distance Bucket'
+            columns added, and the same data encoded as CSV bytes for download.
+    """
+    df = load_locations(raw)
+
+    # 1. Calculate distances
+    # Keep full precision; values are rounded only when displayed or exported
+    codes = np.empty(len(df), dtype=np.int8)
+    distances = calculate_distances(df, within_society, codes)
+
+    # 2. Bucketize distances. The codes were filled alongside the distances; keeping them as an
+    # ordered categorical costs one byte per row, lets bucket counts work on the codes rather
+    # than hashing a string per row, and sorts the buckets by distance rather than alphabetically
+    buckets = pd.Categorical.from_codes(codes, categories=BUCKET_LABELS, ordered=True)
+
+    # Attach both new columns in one step instead of one column insert each
+    df = df.assign(**{'Distance (km)': distances, 'Distance Bucket': buckets})
+
+    # Encode the download here so it is cached under the same raw-input key; caching it
+    # separately would hash the whole processed DataFrame on every rerun
+    return df, convert_df_to_csv(df)
 
 # --- Streamlit App UI ---
 
+# Maximum number of processed rows rendered in the results table
+PREVIEW_ROWS = 10_000
+
 st.title("Location Distance and Bucketing Tool")
 st.write("Paste your location data below, including a 'Society ID', or upload a CSV/text file. The tool will calculate the distance between each consecutive point and categorize it into buckets.")
 
@@ -90,6 +294,12 @@ with col2:
         help="The file should have columns: 'Society ID', 'Latitude', 'Longitude', separated by spaces or commas."
     )
 
+within_society = st.checkbox(
+    "Only measure distances within the same Society ID",
+    value=False,
+    help="When checked, each point is compared with the previous point of the same society instead of the previous row. The first point of every society gets no distance."
+)
+
 # --- Processing Logic ---
 
 # Check if there is any input to process
@@ -97,35 +307,27 @@ if uploaded_file is not None or text_input:
     try:
         # Determine the data source
         if uploaded_file is not None:
-            # If a file is uploaded, read it. Use `delim_whitespace` to handle space-separated values.
-            df = pd.read_csv(uploaded_file, header=None, delim_whitespace=True, names=['Society ID', 'Latitude', 'Longitude'])
+            # If a file is uploaded, use its raw bytes.
+            raw = uploaded_file.getvalue()
         else:
             # Otherwise, use the text input.
-            data = io.StringIO(text_input)
-            df = pd.read_csv(data, header=None, delim_whitespace=True, names=['Society ID', 'Latitude', 'Longitude'])
-
-        # 1. Calculate distances
-        df['Distance (km)'] = calculate_distances(df)
-        df['Distance (km)'] = df['Distance (km)'].round(2) # Round for cleaner display
-
-        # 2. Bucketize distances
-        df['Distance Bucket'] = df['Distance (km)'].apply(bucketize_distance)
+            raw = text_input.encode('utf-8')
+        df, csv = process_locations(raw, within_society)
 
         # --- Display Results ---
         st.subheader("Processed Data with Distances and Buckets")
-        st.write("Showing all rows. Non-zero distances indicate movement from the previous point.")
-        st.dataframe(df)
+        st.write("Non-zero distances indicate movement from the previous point.")
+        # Only ship a preview to the browser; the download below always has every row
+        st.dataframe(
+            df.head(PREVIEW_ROWS),
+            column_config={'Distance (km)': st.column_config.NumberColumn(format="%.2f")}, # Round for cleaner display
+        )
+        if len(df) > PREVIEW_ROWS:
+            st.caption(f"Showing {PREVIEW_ROWS:,} of {len(df):,} rows. Download the CSV for the full data.")
 
         # --- ADD A DOWNLOAD BUTTON ---
         st.subheader("Download Processed Data")
         
-        # Convert DataFrame to CSV format in memory
-        @st.cache_data
-        def convert_df_to_csv(df_to_convert):
-            return df_to_convert.to_csv(index=False).encode('utf-8')
-
-        csv = convert_df_to_csv(df)
-
         st.download_button(
            label="Download data as CSV",
            data=csv,
@@ -146,11 +348,12 @@ if uploaded_file is not None or text_input:
             "< 1 km",
         ]
 
-        # First, create a new DataFrame that ONLY includes rows where there was a move.
-        moving_df = df[df['Distance (km)'] > 0]
-
-        # Now, create the bucket counts from this filtered DataFrame.
-        bucket_counts = moving_df['Distance Bucket'].value_counts().reindex(bucket_order).fillna(0).astype(int)
+        # Count every bucket with a single histogram over the categorical codes. Rows without a
+        # move are exactly the "N/A" bucket, so dropping it leaves only the movements.
+        counts = np.bincount(df['Distance Bucket'].cat.codes, minlength=len(BUCKET_LABELS))
+        bucket_counts = pd.Series(
+            counts, index=pd.Index(BUCKET_LABELS, name='Distance Bucket'), name='count'
+        ).reindex(bucket_order)
 
         st.table(bucket_counts)
 